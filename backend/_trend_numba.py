@@ -0,0 +1,73 @@
+# Compiled habit trend classification for long habit histories
+import numpy as np
+
+TREND_INSUFFICIENT = -1
+TREND_STABLE = 0
+TREND_IMPROVING = 1
+TREND_DECLINING = 2
+
+def _compute_trends_numpy(arr: np.ndarray):
+    """Per-column (recent_avg, older_avg, trend_code) over an (entries, metrics) array with NaN gaps"""
+    present = ~np.isnan(arr)
+    counts = present.sum(axis=0)
+    values = np.where(present, arr, 0.0)
+
+    # Rank each recorded value from the end of its own column: 1..3 are the latest three
+    rank_from_end = np.flip(np.cumsum(np.flip(present, axis=0), axis=0), axis=0)
+    recent = present & (rank_from_end <= 3)
+    older = present & (rank_from_end > 3)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recent_avg = (values * recent).sum(axis=0) / 3
+        older_count = older.sum(axis=0)
+        older_avg = np.where(older_count > 0, (values * older).sum(axis=0) / older_count, recent_avg)
+    trend_codes = np.select(
+        [counts < 3, recent_avg > older_avg * 1.1, recent_avg < older_avg * 0.9],
+        [TREND_INSUFFICIENT, TREND_IMPROVING, TREND_DECLINING],
+        default=TREND_STABLE
+    ).astype(np.int8)
+    return recent_avg, older_avg, trend_codes
+
+try:
+    from numba import njit
+except ImportError:
+    compute_trends = _compute_trends_numpy
+else:
+    # NaN marks missing values, so fastmath must not assume finite inputs
+    @njit(cache=True, fastmath={"reassoc", "contract"})
+    def compute_trends(arr):
+        entries, metrics = arr.shape
+        recent_avg = np.zeros(metrics, dtype=np.float64)
+        older_avg = np.zeros(metrics, dtype=np.float64)
+        trend_codes = np.full(metrics, TREND_INSUFFICIENT, dtype=np.int8)
+
+        for j in range(metrics):
+            seen = 0
+            recent_sum = 0.0
+            older_sum = 0.0
+            # Walk backwards so the first three values seen are the most recent
+            for i in range(entries - 1, -1, -1):
+                value = arr[i, j]
+                if np.isnan(value):
+                    continue
+                if seen < 3:
+                    recent_sum += value
+                else:
+                    older_sum += value
+                seen += 1
+
+            if seen < 3:
+                continue
+            recent_avg[j] = recent_sum / 3
+            older_avg[j] = older_sum / (seen - 3) if seen > 3 else recent_avg[j]
+            if recent_avg[j] > older_avg[j] * 1.1:
+                trend_codes[j] = TREND_IMPROVING
+            elif recent_avg[j] < older_avg[j] * 0.9:
+                trend_codes[j] = TREND_DECLINING
+            else:
+                trend_codes[j] = TREND_STABLE
+
+        return recent_avg, older_avg, trend_codes
+
+    # Compile at import so the first request doesn't pay the JIT cost
+    compute_trends(np.zeros((4, 1), dtype=np.float64))
@@ -1,35 +1,50 @@
 # AI Services for Hackathon Features
-import json
 import asyncio
-from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Any, Optional
+import copy
+import hashlib
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional, Tuple
 import logging
+from cachetools import TTLCache
+from pydantic import BaseModel
 from emergentintegrations.llm.chat import LlmChat, UserMessage
+from model_defaults import uuid7_str
+from llm_pool import LLM_SLOTS
+from _trend_numba import compute_trends, TREND_INSUFFICIENT, TREND_STABLE, TREND_IMPROVING, TREND_DECLINING
+import numpy as np
+import orjson
 import os
+import re
 
 logger = logging.getLogger(__name__)
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
 
-class AIHealthAssistant:
-    """AI-powered health assistant for real-time consultations"""
-    
-    @staticmethod
-    async def get_health_consultation(user_data: Dict, message: str, session_context: List[Dict] = None) -> Dict[str, Any]:
-        """Get AI health consultation response"""
-        try:
-            # Build context from user's health data
-            context = AIHealthAssistant._build_user_context(user_data)
-            
-            # Add session history if available
-            if session_context:
-                context += "\n\nConversation History:\n"
-                for msg in session_context[-5:]:  # Last 5 messages for context
-                    context += f"{msg['message_type']}: {msg['content']}\n"
-            
-            chat = LlmChat(
-                api_key=EMERGENT_LLM_KEY,
-                session_id=f"health_assistant_{user_data.get('id', 'unknown')}",
-                system_message="""You are Dr. HealthSync, an expert AI health assistant. You provide:
+def _compile_keywords(keywords, flags: int = 0) -> re.Pattern:
+    """Compile keywords into one alternation, longest first so phrases win over their substrings"""
+    return re.compile("|".join(re.escape(k) for k in sorted(keywords, key=lambda k: (-len(k), k))), flags)
+
+_EMERGENCY_KEYWORDS = frozenset({"emergency", "urgent", "severe", "critical", "immediately", "hospital", "911", "chest pain", "breathing", "unconscious"})
+_HIGH_KEYWORDS = frozenset({"pain", "fever", "bleeding", "dizzy", "nausea", "doctor"})
+
+# Keyword -> urgency level, scanned in a single pass over the lowercased text
+_URGENCY_LEVELS = {**dict.fromkeys(_HIGH_KEYWORDS, "high"), **dict.fromkeys(_EMERGENCY_KEYWORDS, "emergency")}
+_URGENCY_RE = _compile_keywords(_URGENCY_LEVELS)
+_EMERGENCY_RE = _compile_keywords(_EMERGENCY_KEYWORDS)
+_EMERGENCY_KEYWORD_MAX_LEN = max(map(len, _EMERGENCY_KEYWORDS))
+
+# (keywords, combinator, recommendation) - all() requires every keyword, any() just one
+_RECOMMENDATION_RULES = (
+    (("drink", "water"), all, "Increase water intake"),
+    (("exercise",), any, "Regular physical activity"),
+    (("sleep",), any, "Improve sleep habits"),
+    (("doctor", "medical"), any, "Consult healthcare provider"),
+    (("medication",), any, "Review medication schedule"),
+)
+# Case-insensitive so long responses are scanned once instead of lowercased first
+_RECOMMENDATION_RE = _compile_keywords({k for keywords, _, _ in _RECOMMENDATION_RULES for k in keywords}, re.IGNORECASE)
+
+# System prompts stay byte-identical across calls so the provider can reuse the cached prefix
+_HEALTH_ASSISTANT_PROMPT = """You are Dr. HealthSync, an expert AI health assistant. You provide:
 
 1. PERSONALIZED health advice based on user data
 2. EVIDENCE-BASED medical information  
@@ -51,32 +66,299 @@ NEVER:
 - Give advice outside your competence
 
 Format responses as friendly, conversational advice with clear action items."""
-            ).with_model("openai", "gpt-4o")
-            
-            user_message = UserMessage(
-                text=f"User Context: {context}\n\nUser Question: {message}\n\nProvide personalized health advice considering their current health status, habits, and goals."
-            )
-            
-            response = await chat.send_message(user_message)
+
+_HEALTH_PREDICTION_PROMPT = """You are an expert AI health analyst specializing in predictive analytics. Analyze user health data to:
+
+1. IDENTIFY health trends and patterns
+2. PREDICT potential health risks
+3. CALCULATE risk percentages with confidence levels
+4. PROVIDE specific preventive recommendations
+5. SUGGEST optimal health goals
+
+Return analysis as JSON with:
+- overall_health_score: 0-100
+- risk_predictions: [{"condition": "name", "risk_level": "low/medium/high", "risk_percentage": 0-100, "confidence": 0-100, "factors": [], "timeline": "months"}]
+- trend_analysis: {"improving": [], "declining": [], "stable": []}
+- recommendations: []
+- predicted_outcomes: []
+
+Be scientific, accurate, and actionable."""
+
+_EMERGENCY_DETECTION_PROMPT = """You are an emergency health detection AI. Analyze user data for signs of medical emergencies:
+
+DETECT:
+- Severe symptom patterns
+- Dangerous vital signs
+- Emergency keywords in messages
+- Sudden health deterioration
+- Mental health crises
+
+Return JSON ONLY if emergency detected:
+{
+  "emergency_detected": true,
+  "severity": "high/critical",
+  "type": "medical/mental_health/medication",
+  "indicators": [],
+  "recommended_action": "call_911/urgent_care/doctor",
+  "message": "Clear emergency description"
+}
+
+Return {"emergency_detected": false} if no emergency."""
+
+_MEDICATION_CHECK_PROMPT = """You are an expert pharmaceutical AI assistant. Analyze medication lists for:
+
+1. DRUG INTERACTIONS (major, moderate, minor)
+2. SAFETY WARNINGS and contraindications
+3. DOSAGE CONCERNS
+4. TIMING RECOMMENDATIONS
+5. FOOD/LIFESTYLE interactions
+
+Return JSON with:
+- interaction_level: "none/minor/moderate/major/severe"
+- interactions: [{"drug1": "name", "drug2": "name", "severity": "level", "description": "text", "recommendation": "text"}]
+- warnings: []
+- recommendations: []
+- safe_to_take: boolean
+
+Be extremely cautious and always recommend consulting healthcare providers for medication decisions."""
+
+# JSON schemas mirroring the shapes described in the prompts above
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+_HEALTH_PREDICTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "overall_health_score": {"type": "number"},
+        "risk_predictions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "condition": {"type": "string"},
+                    "risk_level": {"type": "string", "enum": ["low", "medium", "high"]},
+                    "risk_percentage": {"type": "number"},
+                    "confidence": {"type": "number"},
+                    "factors": _STRING_LIST,
+                    "timeline": {"type": "string"}
+                },
+                "required": ["condition", "risk_level", "risk_percentage", "confidence", "factors", "timeline"]
+            }
+        },
+        "trend_analysis": {
+            "type": "object",
+            "properties": {"improving": _STRING_LIST, "declining": _STRING_LIST, "stable": _STRING_LIST},
+            "required": ["improving", "declining", "stable"]
+        },
+        "recommendations": _STRING_LIST,
+        "predicted_outcomes": _STRING_LIST
+    },
+    "required": ["overall_health_score", "risk_predictions", "trend_analysis", "recommendations", "predicted_outcomes"]
+}
+
+_MEDICATION_CHECK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "interaction_level": {"type": "string", "enum": ["none", "minor", "moderate", "major", "severe"]},
+        "interactions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "drug1": {"type": "string"},
+                    "drug2": {"type": "string"},
+                    "severity": {"type": "string"},
+                    "description": {"type": "string"},
+                    "recommendation": {"type": "string"}
+                },
+                "required": ["drug1", "drug2", "severity", "description", "recommendation"]
+            }
+        },
+        "warnings": _STRING_LIST,
+        "recommendations": _STRING_LIST,
+        "safe_to_take": {"type": "boolean"}
+    },
+    "required": ["interaction_level", "interactions", "warnings", "recommendations", "safe_to_take"]
+}
+
+_EMERGENCY_DETECTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "emergency_detected": {"type": "boolean"},
+        "severity": {"type": "string", "enum": ["high", "critical"]},
+        "type": {"type": "string", "enum": ["medical", "mental_health", "medication"]},
+        "indicators": _STRING_LIST,
+        "recommended_action": {"type": "string", "enum": ["call_911", "urgent_care", "doctor"]},
+        "message": {"type": "string"}
+    },
+    "required": ["emergency_detected"]
+}
+
+_CONSULTATION_FALLBACK = {
+    "response": "I'm experiencing technical difficulties right now. For urgent health concerns, please contact your healthcare provider or emergency services immediately.",
+    "urgency_level": "medium",
+    "recommendations": ["Contact healthcare provider", "Monitor symptoms"],
+    "follow_up_suggested": True
+}
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC
+
+def _orjson_default(obj: Any) -> Any:
+    """Serialize what orjson can't natively: Pydantic models as dicts, anything else (ObjectId...) as str"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    return str(obj)
+
+def _dumps(data: Any) -> str:
+    """Compact orjson encoding of an AI payload; indentation only adds billable whitespace tokens"""
+    return orjson.dumps(data, option=_ORJSON_OPTIONS, default=_orjson_default).decode()
+
+# Only the profile fields the analysis prompts can use; names and emails stay out of the prompt
+_ANALYTICS_FIELDS = ("age", "health_score", "tokens", "health_goals")
+# Record summary excerpts: short in the per-message chat context, longer for the one-off trend analysis
+_CONTEXT_SUMMARY_CHARS = 100
+_SUMMARY_PREVIEW_CHARS = 200
+
+def _slim_profile(user_data: Dict) -> Dict[str, Any]:
+    return {k: user_data[k] for k in _ANALYTICS_FIELDS if k in user_data}
+
+def _round_floats(data: Any, ndigits: int = 2) -> Any:
+    """Round every float in a nested payload; extra digits are tokens without signal"""
+    if isinstance(data, float):
+        return round(data, ndigits)
+    if isinstance(data, dict):
+        return {k: _round_floats(v, ndigits) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_round_floats(v, ndigits) for v in data]
+    return data
+
+# Parsed interaction reports keyed by MedicationInteractionChecker._regimen_key, kept for 30 days
+_interaction_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30 * 86400)
+
+def _json_schema_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}
+
+def _new_chat(session_prefix: str, system_message: str, response_format: Optional[Dict[str, Any]] = None) -> LlmChat:
+    """Fresh gpt-4o chat per call, with structured JSON output when a format is given
+
+    LlmChat keeps message history, so a chat shared across calls would grow every prompt
+    and leak one patient's conversation into another's.
+    """
+    chat = LlmChat(
+        api_key=EMERGENT_LLM_KEY,
+        session_id=f"{session_prefix}_{uuid7_str()}",
+        system_message=system_message
+    ).with_model("openai", "gpt-4o")
+    # Older SDK releases have no with_params; the prompt still describes the JSON shape for them
+    if response_format is not None and hasattr(chat, "with_params"):
+        chat = chat.with_params(response_format=response_format)
+    return chat
+
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+def _parse_json_reply(response: str) -> Dict[str, Any]:
+    """Parse a JSON object reply, tolerating markdown fences or prose around the object"""
+    text = _JSON_FENCE_RE.sub("", response.strip())
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            raise
+        return orjson.loads(text[start:end + 1])
+
+async def _send(chat: LlmChat, user_message: UserMessage) -> str:
+    async with LLM_SLOTS:
+        return await chat.send_message(user_message)
+
+async def _stream_reply(chat: LlmChat, user_message: UserMessage):
+    """Yield reply chunks as they arrive, or the whole reply at once if the SDK cannot stream"""
+    send_message_stream = getattr(chat, "send_message_stream", None)
+    if send_message_stream is None:
+        yield await _send(chat, user_message)
+        return
+    async with LLM_SLOTS:
+        async for chunk in send_message_stream(user_message):
+            yield chunk
+
+class AIHealthAssistant:
+    """AI-powered health assistant for real-time consultations"""
+    
+    @staticmethod
+    async def get_health_consultation(user_data: Dict, message: str, session_context: List[Dict] = None) -> Dict[str, Any]:
+        """Get AI health consultation response"""
+        try:
+            chat, user_message = AIHealthAssistant._prepare_consultation(user_data, message, session_context)
+            response = await _send(chat, user_message)
             
             # Analyze response for urgency/emergency keywords
             urgency_level = AIHealthAssistant._analyze_urgency(message, response)
-            
-            return {
-                "response": response,
-                "urgency_level": urgency_level,
-                "recommendations": AIHealthAssistant._extract_recommendations(response),
-                "follow_up_suggested": "doctor" in response.lower() or "medical" in response.lower()
-            }
+            return AIHealthAssistant._consultation_result(response, urgency_level)
             
         except Exception as e:
             logger.error(f"AI consultation error: {e}")
-            return {
-                "response": "I'm experiencing technical difficulties right now. For urgent health concerns, please contact your healthcare provider or emergency services immediately.",
-                "urgency_level": "medium",
-                "recommendations": ["Contact healthcare provider", "Monitor symptoms"],
-                "follow_up_suggested": True
-            }
+            return dict(_CONSULTATION_FALLBACK)
+    
+    @staticmethod
+    async def stream_health_consultation(user_data: Dict, message: str, session_context: List[Dict] = None):
+        """Stream consultation chunks as they arrive, stopping early when an emergency is detected
+        
+        Yields {"type": "delta", "content": chunk} events followed by one {"type": "done", ...}
+        event carrying the same fields as get_health_consultation.
+        """
+        parts = []
+        try:
+            chat, user_message = AIHealthAssistant._prepare_consultation(user_data, message, session_context)
+            
+            emergency = False
+            tail = ""
+            # aclosing() cancels the remaining generation when we stop early
+            async with aclosing(_stream_reply(chat, user_message)) as chunks:
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    yield {"type": "delta", "content": chunk}
+                    
+                    # Keep enough of the previous chunk to catch keywords split across chunks
+                    tail = tail[-(_EMERGENCY_KEYWORD_MAX_LEN - 1):] + chunk.lower()
+                    if _EMERGENCY_RE.search(tail):
+                        emergency = True
+                        break
+            
+            response = "".join(parts)
+            urgency_level = "emergency" if emergency else AIHealthAssistant._analyze_urgency(message, response)
+            yield {"type": "done", **AIHealthAssistant._consultation_result(response, urgency_level)}
+            
+        except Exception as e:
+            logger.error(f"AI consultation stream error: {e}")
+            yield {"type": "done", **_CONSULTATION_FALLBACK}
+    
+    @staticmethod
+    def _prepare_consultation(user_data: Dict, message: str, session_context: Optional[List[Dict]]) -> Tuple[LlmChat, UserMessage]:
+        """Build a fresh chat and the context-rich user message for a consultation"""
+        # Build context from user's health data
+        context = AIHealthAssistant._build_user_context(user_data)
+        
+        # Add session history if available
+        if session_context:
+            context += "\n\nConversation History:\n"
+            for msg in session_context[-5:]:  # Last 5 messages for context
+                context += f"{msg['message_type']}: {msg['content']}\n"
+        
+        chat = _new_chat("health_assistant", _HEALTH_ASSISTANT_PROMPT)
+        
+        user_message = UserMessage(
+            text=f"User Context: {context}\n\nUser Question: {message}\n\nProvide personalized health advice considering their current health status, habits, and goals."
+        )
+        return chat, user_message
+    
+    @staticmethod
+    def _consultation_result(response: str, urgency_level: str) -> Dict[str, Any]:
+        response_lower = response.lower()
+        return {
+            "response": response,
+            "urgency_level": urgency_level,
+            "recommendations": AIHealthAssistant._extract_recommendations(response),
+            "follow_up_suggested": "doctor" in response_lower or "medical" in response_lower
+        }
     
     @staticmethod
     def _build_user_context(user_data: Dict) -> str:
@@ -104,65 +386,59 @@ Health Goals:
         if not habits:
             return "- No recent habit data available"
         
-        formatted = []
-        for habit in habits[:3]:  # Last 3 habits
-            formatted.append(f"- {habit.get('date', 'Recent')}: Sleep {habit.get('sleep_hours', 'N/A')}h, Exercise {habit.get('exercise_minutes', 'N/A')}min, Mood {habit.get('mood_rating', 'N/A')}/5")
-        return "\n".join(formatted)
+        return "\n".join(
+            f"- {habit.get('date', 'Recent')}: Sleep {habit.get('sleep_hours', 'N/A')}h, Exercise {habit.get('exercise_minutes', 'N/A')}min, Mood {habit.get('mood_rating', 'N/A')}/5"
+            for habit in habits[:3]  # Last 3 habits
+        )
     
     @staticmethod
     def _format_medical_records(records: List) -> str:
         if not records:
             return "- No recent medical records"
         
-        formatted = []
-        for record in records[:2]:  # Last 2 records
-            formatted.append(f"- {record.get('filename', 'Medical Record')}: {record.get('ai_summary', 'No summary available')[:100]}...")
-        return "\n".join(formatted)
+        return "\n".join(
+            f"- {record.get('filename', 'Medical Record')}: {record.get('ai_summary', 'No summary available')[:_CONTEXT_SUMMARY_CHARS]}..."
+            for record in records[:2]  # Last 2 records
+        )
     
     @staticmethod
     def _format_health_goals(goals: List) -> str:
         if not goals:
             return "- No specific health goals set"
         
-        formatted = []
-        for goal in goals[:3]:  # Top 3 goals
-            formatted.append(f"- {goal.get('goal_type', 'Health Goal')}: Target {goal.get('target_value', 'N/A')} {goal.get('unit', '')}")
-        return "\n".join(formatted)
+        return "\n".join(
+            f"- {goal.get('goal_type', 'Health Goal')}: Target {goal.get('target_value', 'N/A')} {goal.get('unit', '')}"
+            for goal in goals[:3]  # Top 3 goals
+        )
     
     @staticmethod
     def _analyze_urgency(message: str, response: str) -> str:
         """Analyze message and response for urgency level"""
-        emergency_keywords = ["emergency", "urgent", "severe", "critical", "immediately", "hospital", "911", "chest pain", "breathing", "unconscious"]
-        high_keywords = ["pain", "fever", "bleeding", "dizzy", "nausea", "doctor"]
-        
-        text_to_check = (message + " " + response).lower()
+        text_to_check = f"{message} {response}".lower()
         
-        if any(keyword in text_to_check for keyword in emergency_keywords):
-            return "emergency"
-        elif any(keyword in text_to_check for keyword in high_keywords):
-            return "high"
-        else:
-            return "medium"
+        urgency_level = "medium"
+        for match in _URGENCY_RE.finditer(text_to_check):
+            if _URGENCY_LEVELS[match.group()] == "emergency":
+                return "emergency"
+            urgency_level = "high"
+        return urgency_level
     
     @staticmethod
     def _extract_recommendations(response: str) -> List[str]:
         """Extract actionable recommendations from AI response"""
-        # Simple keyword-based extraction (can be enhanced with NLP)
-        recommendations = []
-        
-        if "drink" in response.lower() and "water" in response.lower():
-            recommendations.append("Increase water intake")
-        if "exercise" in response.lower():
-            recommendations.append("Regular physical activity")
-        if "sleep" in response.lower():
-            recommendations.append("Improve sleep habits")
-        if "doctor" in response.lower() or "medical" in response.lower():
-            recommendations.append("Consult healthcare provider")
-        if "medication" in response.lower():
-            recommendations.append("Review medication schedule")
-            
+        found = {match.lower() for match in _RECOMMENDATION_RE.findall(response)}
+        recommendations = [
+            label for keywords, combinator, label in _RECOMMENDATION_RULES
+            if combinator(k in found for k in keywords)
+        ]
         return recommendations[:3]  # Top 3 recommendations
 
+# Below this many habit entries the thread hop costs more than it saves
+_THREAD_OFFLOAD_MIN_HABITS = 1024
+
+_TREND_METRICS = ("sleep_hours", "exercise_minutes", "mood_rating", "stress_level", "water_glasses")
+_TREND_LABELS = {TREND_STABLE: "stable", TREND_IMPROVING: "improving", TREND_DECLINING: "declining"}
+
 class PredictiveHealthAnalytics:
     """AI-powered predictive health analytics"""
     
@@ -170,48 +446,33 @@ class PredictiveHealthAnalytics:
     async def analyze_health_trends(user_data: Dict, habits_data: List, records_data: List) -> Dict[str, Any]:
         """Comprehensive health trend analysis and risk prediction"""
         try:
-            chat = LlmChat(
-                api_key=EMERGENT_LLM_KEY,
-                session_id=f"health_prediction_{user_data.get('id', 'unknown')}",
-                system_message="""You are an expert AI health analyst specializing in predictive analytics. Analyze user health data to:
-
-1. IDENTIFY health trends and patterns
-2. PREDICT potential health risks
-3. CALCULATE risk percentages with confidence levels
-4. PROVIDE specific preventive recommendations
-5. SUGGEST optimal health goals
-
-Return analysis as JSON with:
-- overall_health_score: 0-100
-- risk_predictions: [{"condition": "name", "risk_level": "low/medium/high", "risk_percentage": 0-100, "confidence": 0-100, "factors": [], "timeline": "months"}]
-- trend_analysis: {"improving": [], "declining": [], "stable": []}
-- recommendations: []
-- predicted_outcomes: []
-
-Be scientific, accurate, and actionable."""
-            ).with_model("openai", "gpt-4o")
+            chat = _new_chat(
+                "health_prediction",
+                _HEALTH_PREDICTION_PROMPT,
+                _json_schema_format("health_prediction", _HEALTH_PREDICTION_SCHEMA)
+            )
             
-            # Prepare comprehensive data
-            analysis_data = {
-                "user_profile": user_data,
-                "habit_trends": PredictiveHealthAnalytics._analyze_habit_trends(habits_data),
-                "medical_history": [{"summary": r.get("ai_summary", ""), "risk_assessment": r.get("risk_assessment", "")} for r in records_data],
-                "current_metrics": PredictiveHealthAnalytics._calculate_current_metrics(habits_data)
-            }
+            # Prepare comprehensive data; long histories are crunched off the event loop
+            if len(habits_data) > _THREAD_OFFLOAD_MIN_HABITS:
+                analysis_data = await asyncio.to_thread(
+                    PredictiveHealthAnalytics._compute_analytics_sync, user_data, habits_data, records_data
+                )
+            else:
+                analysis_data = PredictiveHealthAnalytics._compute_analytics_sync(user_data, habits_data, records_data)
             
             user_message = UserMessage(
                 text=f"""Analyze this comprehensive health data for predictive insights:
 
-{json.dumps(analysis_data, indent=2)}
+{_dumps(analysis_data)}
 
 Provide detailed health predictions, risk analysis, and actionable recommendations in JSON format."""
             )
             
-            response = await chat.send_message(user_message)
+            response = await _send(chat, user_message)
             
             try:
-                prediction_data = json.loads(response)
-            except json.JSONDecodeError:
+                prediction_data = _parse_json_reply(response)
+            except orjson.JSONDecodeError:
                 # Fallback structured response
                 prediction_data = PredictiveHealthAnalytics._create_fallback_analysis(user_data, habits_data)
             
@@ -221,34 +482,42 @@ Provide detailed health predictions, risk analysis, and actionable recommendatio
             logger.error(f"Predictive analysis error: {e}")
             return PredictiveHealthAnalytics._create_fallback_analysis(user_data, habits_data)
     
+    @staticmethod
+    def _compute_analytics_sync(user_data: Dict, habits_data: List, records_data: List) -> Dict[str, Any]:
+        """Assemble the analysis payload; pure CPU work, safe to run in a worker thread"""
+        return _round_floats({
+            "user_profile": _slim_profile(user_data),
+            "habit_trends": PredictiveHealthAnalytics._analyze_habit_trends(habits_data),
+            "medical_history": [
+                {"summary": (r.get("ai_summary") or "")[:_SUMMARY_PREVIEW_CHARS], "risk_assessment": r.get("risk_assessment", "")}
+                for r in records_data
+            ],
+            "current_metrics": PredictiveHealthAnalytics._calculate_current_metrics(habits_data)
+        })
+    
+    @staticmethod
+    def _habit_matrix(habits_data: List) -> np.ndarray:
+        """Stack tracked habit metrics into an (entries, metrics) array with NaN for missing values"""
+        return np.array([[h.get(m) for m in _TREND_METRICS] for h in habits_data], dtype=np.float64).reshape(-1, len(_TREND_METRICS))
+    
     @staticmethod
     def _analyze_habit_trends(habits_data: List) -> Dict[str, Any]:
         """Analyze trends in user habits"""
         if not habits_data:
             return {"trends": "insufficient_data"}
         
-        trends = {}
-        metrics = ["sleep_hours", "exercise_minutes", "mood_rating", "stress_level", "water_glasses"]
+        recent_avg, older_avg, trend_codes = compute_trends(PredictiveHealthAnalytics._habit_matrix(habits_data))
         
-        for metric in metrics:
-            values = [h.get(metric) for h in habits_data if h.get(metric) is not None]
-            if len(values) >= 3:
-                # Simple trend analysis
-                recent_avg = sum(values[-3:]) / 3 if len(values) >= 3 else sum(values) / len(values)
-                older_avg = sum(values[:-3]) / len(values[:-3]) if len(values) > 3 else recent_avg
-                
-                if recent_avg > older_avg * 1.1:
-                    trend = "improving"
-                elif recent_avg < older_avg * 0.9:
-                    trend = "declining"
-                else:
-                    trend = "stable"
-                
-                trends[metric] = {
-                    "trend": trend,
-                    "recent_average": recent_avg,
-                    "change_percentage": ((recent_avg - older_avg) / older_avg * 100) if older_avg > 0 else 0
-                }
+        trends = {}
+        for i, metric in enumerate(_TREND_METRICS):
+            if trend_codes[i] == TREND_INSUFFICIENT:
+                continue
+            recent, older = float(recent_avg[i]), float(older_avg[i])
+            trends[metric] = {
+                "trend": _TREND_LABELS[int(trend_codes[i])],
+                "recent_average": recent,
+                "change_percentage": ((recent - older) / older * 100) if older > 0 else 0
+            }
         
         return trends
     
@@ -258,15 +527,16 @@ Provide detailed health predictions, risk analysis, and actionable recommendatio
         if not habits_data:
             return {}
         
-        recent_habits = habits_data[-7:]  # Last week
-        metrics = {}
+        arr = PredictiveHealthAnalytics._habit_matrix(habits_data[-7:])  # Last week
+        present = ~np.isnan(arr)
+        counts = present.sum(axis=0)
+        sums = np.where(present, arr, 0.0).sum(axis=0)
         
-        for metric in ["sleep_hours", "exercise_minutes", "mood_rating", "stress_level", "water_glasses"]:
-            values = [h.get(metric) for h in recent_habits if h.get(metric) is not None]
-            if values:
-                metrics[f"avg_{metric}"] = sum(values) / len(values)
-        
-        return metrics
+        return {
+            f"avg_{metric}": float(sums[i] / counts[i])
+            for i, metric in enumerate(_TREND_METRICS)
+            if counts[i]
+        }
     
     @staticmethod
     def _create_fallback_analysis(user_data: Dict, habits_data: List) -> Dict[str, Any]:
@@ -318,44 +588,35 @@ class MedicationInteractionChecker:
     async def check_medication_interactions(medications: List[Dict], new_medication: Dict = None) -> Dict[str, Any]:
         """Check for medication interactions and safety warnings"""
         try:
-            chat = LlmChat(
-                api_key=EMERGENT_LLM_KEY,
-                session_id=f"medication_check_{datetime.now().timestamp()}",
-                system_message="""You are an expert pharmaceutical AI assistant. Analyze medication lists for:
-
-1. DRUG INTERACTIONS (major, moderate, minor)
-2. SAFETY WARNINGS and contraindications
-3. DOSAGE CONCERNS
-4. TIMING RECOMMENDATIONS
-5. FOOD/LIFESTYLE interactions
-
-Return JSON with:
-- interaction_level: "none/minor/moderate/major/severe"
-- interactions: [{"drug1": "name", "drug2": "name", "severity": "level", "description": "text", "recommendation": "text"}]
-- warnings: []
-- recommendations: []
-- safe_to_take: boolean
-
-Be extremely cautious and always recommend consulting healthcare providers for medication decisions."""
-            ).with_model("openai", "gpt-4o")
-            
             medication_list = medications.copy()
             if new_medication:
                 medication_list.append(new_medication)
             
+            # Interactions depend only on which drugs at which doses, so identical regimens share one answer
+            cache_key = MedicationInteractionChecker._regimen_key(medication_list)
+            cached = _interaction_cache.get(cache_key)
+            if cached is not None:
+                return copy.deepcopy(cached)
+            
+            chat = _new_chat(
+                "medication_check",
+                _MEDICATION_CHECK_PROMPT,
+                _json_schema_format("medication_check", _MEDICATION_CHECK_SCHEMA)
+            )
+            
             user_message = UserMessage(
                 text=f"""Analyze these medications for interactions and safety:
 
-Medications: {json.dumps(medication_list, indent=2)}
+Medications: {_dumps(medication_list)}
 
 Provide comprehensive interaction analysis in JSON format."""
             )
             
-            response = await chat.send_message(user_message)
+            response = await _send(chat, user_message)
             
             try:
-                return json.loads(response)
-            except json.JSONDecodeError:
+                result = _parse_json_reply(response)
+            except orjson.JSONDecodeError:
                 return {
                     "interaction_level": "unknown",
                     "interactions": [],
@@ -363,6 +624,9 @@ Provide comprehensive interaction analysis in JSON format."""
                     "recommendations": ["Verify with healthcare provider"],
                     "safe_to_take": False
                 }
+            
+            _interaction_cache[cache_key] = copy.deepcopy(result)
+            return result
                 
         except Exception as e:
             logger.error(f"Medication interaction check error: {e}")
@@ -373,6 +637,12 @@ Provide comprehensive interaction analysis in JSON format."""
                 "recommendations": ["Contact pharmacist for interaction check"],
                 "safe_to_take": False
             }
+    
+    @staticmethod
+    def _regimen_key(medication_list: List[Dict]) -> str:
+        """Content address of a regimen: BLAKE2b over the sorted (name, dosage) pairs"""
+        regimen = sorted((str(m.get("name", "")).strip().lower(), str(m.get("dosage", "")).strip().lower()) for m in medication_list)
+        return hashlib.blake2b(orjson.dumps(regimen)).hexdigest()
 
 class EmergencyDetectionAI:
     """AI system for detecting health emergencies from user data"""
@@ -383,49 +653,124 @@ class EmergencyDetectionAI:
         try:
             # Combine all recent data
             analysis_context = {
-                "user_profile": user_data,
+                "user_profile": _slim_profile(user_data),
                 "recent_habits": recent_inputs.get("habits", []),
                 "recent_messages": recent_inputs.get("chat_messages", []),
                 "recent_vitals": recent_inputs.get("vitals", [])
             }
             
-            chat = LlmChat(
-                api_key=EMERGENT_LLM_KEY,
-                session_id=f"emergency_detection_{user_data.get('id', 'unknown')}",
-                system_message="""You are an emergency health detection AI. Analyze user data for signs of medical emergencies:
-
-DETECT:
-- Severe symptom patterns
-- Dangerous vital signs
-- Emergency keywords in messages
-- Sudden health deterioration
-- Mental health crises
-
-Return JSON ONLY if emergency detected:
-{
-  "emergency_detected": true,
-  "severity": "high/critical",
-  "type": "medical/mental_health/medication",
-  "indicators": [],
-  "recommended_action": "call_911/urgent_care/doctor",
-  "message": "Clear emergency description"
-}
-
-Return {"emergency_detected": false} if no emergency."""
-            ).with_model("openai", "gpt-4o")
+            chat = _new_chat(
+                "emergency_detection",
+                _EMERGENCY_DETECTION_PROMPT,
+                _json_schema_format("emergency_detection", _EMERGENCY_DETECTION_SCHEMA)
+            )
             
             user_message = UserMessage(
-                text=f"Analyze for health emergencies: {json.dumps(analysis_context)}"
+                text=f"Analyze for health emergencies: {_dumps(_round_floats(analysis_context))}"
             )
             
-            response = await chat.send_message(user_message)
+            response = await _send(chat, user_message)
             
             try:
-                result = json.loads(response)
+                result = _parse_json_reply(response)
                 return result if result.get("emergency_detected") else None
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 return None
                 
         except Exception as e:
             logger.error(f"Emergency detection error: {e}")
-            return None
\ No newline at end of file
+            return None
+class AsyncBatcher:
+    """Queue documents and write them to a collection with insert_many from a background task
+    
+    Flushes when max_batch documents are waiting or flush_ms after the first one arrived,
+    whichever comes first. Intended for high-volume append-only writes such as ChatMessage
+    and MedicationLog rows.
+    """
+    
+    def __init__(self, collection, max_batch: int = 500, flush_ms: int = 50):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+    
+    async def put(self, document: Dict[str, Any]):
+        """Enqueue a document for the next batch, starting the writer on first use"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        await self._queue.put(document)
+    
+    async def close(self):
+        """Flush everything still queued and stop the writer"""
+        await self._queue.join()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+    
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        try:
+            # Unordered so one bad document doesn't block the rest of the batch
+            await self.collection.insert_many(batch, ordered=False)
+        except Exception as e:
+            logger.error(f"Batched insert into {self.collection.name} failed: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+async def run_full_health_assessment(user_data: Dict, habits: List, records: List, inputs: Dict) -> Dict[str, Any]:
+    """Run consultation, trend analysis, medication check and emergency detection concurrently"""
+    coros = {
+        "consultation": AIHealthAssistant.get_health_consultation(
+            user_data,
+            inputs.get("message", "Give me an overview of my current health."),
+            inputs.get("session_context")
+        ),
+        "predictions": PredictiveHealthAnalytics.analyze_health_trends(user_data, habits, records),
+        "medication_check": MedicationInteractionChecker.check_medication_interactions(
+            inputs.get("medications", []),
+            inputs.get("new_medication")
+        ),
+        "emergency": EmergencyDetectionAI.analyze_for_emergencies(user_data, inputs),
+    }
+    
+    # All calls are independent network round-trips: submit them together, then collect
+    results = await asyncio.gather(*coros.values(), return_exceptions=True)
+    
+    assessment = {}
+    for name, result in zip(coros, results):
+        if isinstance(result, Exception):
+            logger.error(f"Health assessment step '{name}' failed: {result}")
+            result = None
+        assessment[name] = result
+    return assessment
+
+async def gather_many(users: List[Dict], max_concurrency: int = 10) -> List[Dict[str, Any]]:
+    """Run full assessments for many users with bounded concurrency to respect provider rate limits"""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def assess(entry: Dict) -> Dict[str, Any]:
+        async with semaphore:
+            return await run_full_health_assessment(
+                entry["user_data"],
+                entry.get("habits", []),
+                entry.get("records", []),
+                entry.get("inputs", {})
+            )
+    
+    return await asyncio.gather(*(assess(entry) for entry in users))
@@ -0,0 +1,28 @@
+# Shared outbound LLM resources: one concurrency limiter and one keep-alive HTTP pool
+import asyncio
+from typing import Optional
+import httpx
+import litellm
+
+# Bounded outbound LLM concurrency for every caller: bursts queue here instead of piling 429s onto the provider
+LLM_SLOTS = asyncio.Semaphore(16)
+
+_http: Optional[httpx.AsyncClient] = None
+
+async def open_http_pool():
+    """Route litellm through one HTTP/2 keep-alive pool instead of a TLS handshake per request; call from the app's startup"""
+    global _http
+    _http = httpx.AsyncClient(
+        http2=True,
+        timeout=30,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    )
+    litellm.aclient_session = _http
+
+async def close_http_pool():
+    """Detach and close the pool opened by open_http_pool; call from the app's shutdown"""
+    global _http
+    if _http is not None:
+        litellm.aclient_session = None
+        await _http.aclose()
+        _http = None
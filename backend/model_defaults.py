@@ -0,0 +1,34 @@
+# Shared default factories for model fields
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+def uuid7_str() -> str:
+    """Time-ordered UUIDv7 string: 48-bit Unix millisecond timestamp followed by random bits"""
+    timestamp_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")  # IDs appear in URLs, so keep them unguessable
+    value = (
+        (timestamp_ms & 0xFFFFFFFFFFFF) << 80
+        | 0x7 << 76                        # version 7
+        | (rand >> 68) << 64               # 12 random bits
+        | 0b10 << 62                       # RFC 4122 variant
+        | rand & 0x3FFFFFFFFFFFFFFF        # 62 random bits
+    )
+    return str(uuid.UUID(int=value))
+
+_cached_now = datetime.now(timezone.utc)
+_cached_at_ns = time.monotonic_ns()
+
+def now_utc() -> datetime:
+    """Current UTC time, shared by every call within the same millisecond
+
+    Bulk inserts build hundreds of models per flush; millisecond precision is ample
+    for created_at/timestamp fields and saves a wall-clock read per model.
+    """
+    global _cached_now, _cached_at_ns
+    now_ns = time.monotonic_ns()
+    if now_ns - _cached_at_ns >= 1_000_000:
+        _cached_now = datetime.now(timezone.utc)
+        _cached_at_ns = now_ns
+    return _cached_now
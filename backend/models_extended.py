@@ -1,29 +1,34 @@
 # Extended Models for Hackathon Features
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timezone
-import uuid
+from datetime import datetime
+from model_defaults import uuid7_str, now_utc
+
+# Append-only log entries are never mutated after construction
+LOG_ENTRY_CONFIG = ConfigDict(frozen=True)
 
 # AI Health Assistant Models
 class ChatMessage(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    model_config = LOG_ENTRY_CONFIG
+    
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     session_id: str
     message_type: str  # "user" or "assistant"
     content: str
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: datetime = Field(default_factory=now_utc)
     context_data: Optional[Dict[str, Any]] = None
 
 class ChatSession(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     session_name: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    last_activity: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=now_utc)
+    last_activity: datetime = Field(default_factory=now_utc)
     is_active: bool = True
 
 class HealthPrediction(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     prediction_type: str  # "cardiovascular", "diabetes", "mental_health", etc.
     risk_level: str  # "low", "medium", "high", "critical"
@@ -32,28 +37,28 @@ class HealthPrediction(BaseModel):
     factors: List[str]
     recommendations: List[str]
     predicted_date: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=now_utc)
 
 # Health Buddy System
 class BuddyRequest(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     requester_id: str
     target_id: str
     message: Optional[str] = None
     status: str = "pending"  # "pending", "accepted", "declined"
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=now_utc)
 
 class BuddyPair(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user1_id: str
     user2_id: str
-    paired_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    paired_date: datetime = Field(default_factory=now_utc)
     shared_goals: List[str] = []
     total_challenges: int = 0
     active_challenges: int = 0
 
 class BuddyChallenge(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     buddy_pair_id: str
     challenge_type: str  # "steps", "exercise", "sleep", "meditation"
     target_value: float
@@ -65,7 +70,7 @@ class BuddyChallenge(BaseModel):
 
 # Virtual Doctor Booking
 class Doctor(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     name: str
     specialization: str
     years_experience: int
@@ -76,7 +81,7 @@ class Doctor(BaseModel):
     profile_image: Optional[str] = None
 
 class DoctorAppointment(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     doctor_id: str
     appointment_datetime: str
@@ -86,11 +91,11 @@ class DoctorAppointment(BaseModel):
     status: str = "scheduled"  # "scheduled", "confirmed", "completed", "cancelled"
     meeting_link: Optional[str] = None
     notes: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=now_utc)
 
 # Smart Medication Tracker
 class Medication(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     name: str
     dosage: str
@@ -103,7 +108,7 @@ class Medication(BaseModel):
     interactions: List[str] = []
 
 class MedicationReminder(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     medication_id: str
     user_id: str
     reminder_time: str
@@ -112,7 +117,9 @@ class MedicationReminder(BaseModel):
     notes: Optional[str] = None
 
 class MedicationLog(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    model_config = LOG_ENTRY_CONFIG
+    
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     medication_id: str
     scheduled_time: str
@@ -123,7 +130,7 @@ class MedicationLog(BaseModel):
 
 # Emergency Contacts System
 class EmergencyContact(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     name: str
     relationship: str  # "spouse", "parent", "child", "doctor", "friend"
@@ -134,7 +141,7 @@ class EmergencyContact(BaseModel):
     preferred_contact_method: str = "phone"  # "phone", "email", "both"
 
 class HealthAlert(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     alert_type: str  # "emergency", "medication_missed", "health_risk", "goal_achievement"
     severity: str  # "low", "medium", "high", "critical"
@@ -143,11 +150,11 @@ class HealthAlert(BaseModel):
     triggered_by: str  # "ai_analysis", "missed_medication", "manual", etc.
     status: str = "active"  # "active", "acknowledged", "resolved"
     contacts_notified: List[str] = []
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=now_utc)
 
 # Health Analytics & Insights
 class HealthInsight(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     insight_type: str  # "trend", "prediction", "recommendation", "warning"
     category: str  # "sleep", "exercise", "nutrition", "mental_health", "overall"
@@ -156,7 +163,7 @@ class HealthInsight(BaseModel):
     data_points: Dict[str, Any]
     confidence_level: float
     priority: str = "medium"  # "low", "medium", "high", "urgent"
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=now_utc)
     expires_at: Optional[datetime] = None
 
 # Request/Response Models
@@ -188,4 +195,9 @@ class EmergencyAlertRequest(BaseModel):
     alert_type: str
     severity: str = "high"
     custom_message: Optional[str] = None
-    notify_contacts: bool = True
\ No newline at end of file
+    notify_contacts: bool = True
+
+# Bulk validators: one pydantic-core pass over a list of Mongo documents
+CHAT_MESSAGES_ADAPTER = TypeAdapter(List[ChatMessage])
+MEDICATION_LOGS_ADAPTER = TypeAdapter(List[MedicationLog])
+HEALTH_ALERTS_ADAPTER = TypeAdapter(List[HealthAlert])
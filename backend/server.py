@@ -1,29 +1,81 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
+from collections import defaultdict
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
-import uuid
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from llm_pool import LLM_SLOTS, open_http_pool, close_http_pool
+from model_defaults import uuid7_str, now_utc
 from datetime import datetime, timezone, timedelta
-import json
+import orjson
+import functools
+import hashlib
 from emergentintegrations.llm.chat import LlmChat, UserMessage
+from cachetools import TTLCache
 import asyncio
 import base64
+import codecs
+import httpx
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# A warm minimum pool absorbs bursts without fresh TCP/TLS handshakes; idle extras are
+# reaped after 30s, and a short server selection timeout fails fast when Mongo is down.
+# TCP keepalive is always enabled by PyMongo 4, so there is no option for it.
+# Timestamps are stored as BSON dates; tz_aware returns them as UTC-aware datetimes.
+client = AsyncMongoClient(
+    mongo_url,
+    tz_aware=True,
+    maxPoolSize=50,
+    minPoolSize=10,
+    maxIdleTimeMS=30000,
+    serverSelectionTimeoutMS=3000,
+    retryWrites=True
+)
 db = client[os.environ['DB_NAME']]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compound indexes follow equality-then-sort so per-user listings skip the in-memory SORT stage
+    await asyncio.gather(
+        db.users.create_index("id", unique=True),
+        db.medical_records.create_index([("user_id", 1), ("upload_date", -1)]),
+        db.habits.create_index([("user_id", 1), ("date", -1)], unique=True),  # one habit log per day
+        db.token_transactions.create_index([("user_id", 1), ("timestamp", -1)]),
+        db.token_transactions.create_index([("user_id", 1), ("transaction_type", 1)]),
+        db.health_goals.create_index([("user_id", 1), ("created_date", -1)]),
+        db.paperwork_templates.create_index([("user_id", 1), ("created_date", -1)]),
+        db.ai_cache.create_index("hash", unique=True),
+        db.ai_cache.create_index("expires_at", expireAfterSeconds=0)
+    )
+    await open_http_pool()
+    token_flusher = asyncio.create_task(flush_token_awards())
+    yield
+    # Let in-flight analyses and detached streams write their results before the client closes
+    await asyncio.gather(*detached_tasks, return_exceptions=True)
+    # The sentinel lets the flusher write whatever is still queued before the client closes
+    token_queue.put_nowait(None)
+    await token_flusher
+    await close_http_pool()
+    await client.close()
+
 # Create the main app without a prefix
-app = FastAPI(title="HealthSync API", description="AI-Powered Medical Records Platform")
+app = FastAPI(
+    title="HealthSync API",
+    description="AI-Powered Medical Records Platform",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -31,13 +83,32 @@ api_router = APIRouter(prefix="/api")
 # AI Chat Setup
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
 
+MEDICAL_ANALYSIS_PROMPT = "You are an expert medical AI assistant. Analyze medical records and reply with a single JSON object."
+PAPERWORK_PROMPT = "You are a professional medical administrative assistant. Generate accurate, complete medical forms and documents following healthcare standards."
+
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+
+LLM_TIMEOUT_SECONDS = 30
+
+def new_llm_chat(session_prefix: str, system_message: str, response_format: Optional[dict] = None) -> LlmChat:
+    """Fresh chat per request: LlmChat keeps message history, so sharing one across patients would leak it"""
+    chat = LlmChat(
+        api_key=EMERGENT_LLM_KEY,
+        session_id=f"{session_prefix}_{uuid7_str()}",
+        system_message=system_message
+    ).with_model("openai", "gpt-4o")
+    # Older SDK releases have no with_params; their replies still go through the JSON fallback parse
+    if response_format is not None and hasattr(chat, "with_params"):
+        chat = chat.with_params(response_format=response_format)
+    return chat
+
 # Models
 class User(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     email: EmailStr
     name: str
     age: Optional[int] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=now_utc)
     tokens: int = 0
     health_score: float = 85.0
     
@@ -46,17 +117,20 @@ class UserCreate(BaseModel):
     name: str
     age: Optional[int] = None
 
-class MedicalRecord(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+class MedicalRecordPreview(BaseModel):
+    """Medical record without its extracted text, for list views"""
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     filename: str
-    content: str
     file_type: str
     file_size: int
-    upload_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    upload_date: datetime = Field(default_factory=now_utc)
     ai_summary: Optional[str] = None
     risk_assessment: Optional[str] = None
     health_metrics: Optional[dict] = None
+
+class MedicalRecord(MedicalRecordPreview):
+    content: str
     
 class MedicalRecordCreate(BaseModel):
     user_id: str
@@ -66,7 +140,7 @@ class MedicalRecordCreate(BaseModel):
     file_size: int = 0
 
 class Habit(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     date: str
     # Physical health
@@ -118,187 +192,308 @@ class PaperworkRequest(BaseModel):
     insurance_info: Optional[str] = None
 
 class PaperworkTemplate(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     template_name: str
     form_type: str
     content: str
-    created_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_date: datetime = Field(default_factory=now_utc)
     is_favorite: bool = False
 
 class HealthGoal(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     goal_type: str  # weight_loss, exercise, sleep, etc.
     target_value: float
     current_value: float
     unit: str
     target_date: str
-    created_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_date: datetime = Field(default_factory=now_utc)
     is_achieved: bool = False
 
+class BatchRequestItem(BaseModel):
+    id: str
+    url: str  # path under /api, e.g. "/api/habits/{user_id}"
+    method: str = "GET"
+
+class BatchRequest(BaseModel):
+    requests: List[BatchRequestItem]
+
 class TokenTransaction(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_str)
     user_id: str
     amount: int
     transaction_type: str  # earned, spent, redeemed
     description: str
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: datetime = Field(default_factory=now_utc)
 
 # Helper Functions
-def prepare_for_mongo(data):
-    """Convert datetime objects to ISO strings for MongoDB storage"""
-    if isinstance(data, dict):
-        for key, value in data.items():
-            if isinstance(value, datetime):
-                data[key] = value.isoformat()
-            elif isinstance(value, dict):
-                data[key] = prepare_for_mongo(value)
-            elif isinstance(value, list):
-                data[key] = [prepare_for_mongo(item) if isinstance(item, dict) else item for item in value]
-    return data
-
-def parse_from_mongo(item):
-    """Convert ISO strings back to datetime objects"""
-    if isinstance(item, dict):
-        for key, value in item.items():
-            if isinstance(value, str) and 'T' in value and value.endswith(('Z', '+00:00')):
-                try:
-                    item[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
-                except ValueError:
-                    pass
-            elif isinstance(value, dict):
-                item[key] = parse_from_mongo(value)
-            elif isinstance(value, list):
-                item[key] = [parse_from_mongo(i) if isinstance(i, dict) else i for i in value]
-    return item
-
-async def extract_text_from_file(file_content: bytes, filename: str) -> str:
-    """Extract text content from uploaded files"""
+# Stored documents are model_dump() output, so minus _id they are already response-shaped
+NO_MONGO_ID = {"_id": 0}
+# Inclusion projection: only the preview fields leave the database, never the content blob
+MEDICAL_RECORD_PREVIEW_PROJECTION = {**NO_MONGO_ID, **dict.fromkeys(MedicalRecordPreview.model_fields, 1)}
+
+# Per-process user documents; writes to a user evict it, other workers see changes within the TTL
+user_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30)
+
+async def load_user(user_id: str) -> Optional[dict]:
+    """User document (without _id) by id, served from user_cache when fresh"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id}, NO_MONGO_ID)
+        if user is not None:
+            user_cache[user_id] = user
+    return user
+
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_UPLOAD_REQUEST_BYTES = MAX_UPLOAD_BYTES + 64 * 1024  # headroom for multipart boundaries and form fields
+UPLOAD_CHUNK_BYTES = 64 * 1024
+TEXT_FILE_EXTENSIONS = ('.txt', '.log', '.json')
+
+async def extract_text_from_file(upload: UploadFile) -> Tuple[str, int]:
+    """Extract text content from an uploaded file; returns (text, size in bytes)
+    
+    Decoding runs in a worker thread that reads the spooled upload directly, keeping the
+    event loop free for other requests while large files are processed.
+    """
+    return await asyncio.to_thread(extract_text_sync, upload.file, upload.filename)
+
+def extract_text_sync(source: BinaryIO, filename: str) -> Tuple[str, int]:
+    """Read the upload in chunks: text formats are decoded incrementally and other files are
+    only measured, so the raw bytes are never held in memory at once. Raises 413 past 10MB.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore') if filename.lower().endswith(TEXT_FILE_EXTENSIONS) else None
+    parts = []
+    size = 0
+    source.seek(0)
+    while chunk := source.read(UPLOAD_CHUNK_BYTES):
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="File too large. Maximum size is 10MB.")
+        if decoder is not None:
+            parts.append(decoder.decode(chunk))
+    
+    if decoder is None:
+        # For other file types, return a description
+        return f"Medical file: {filename}\nFile size: {size} bytes\nUploaded medical document for analysis.", size
+    parts.append(decoder.decode(b'', final=True))
+    return "".join(parts), size
+
+# Bump when an LLM prompt changes so replies cached under the old prompt stop matching
+PROMPT_VERSION = "v2"
+LLM_CACHE_TTL = timedelta(days=7)
+# In-process tier in front of ai_cache; hot entries skip the Mongo round trip
+local_llm_cache: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+
+def llm_cache_key(kind: str, text: str) -> str:
+    """SHA-256 of prompt version, call kind and whitespace/case-normalized text, used as the ai_cache key"""
+    return hashlib.sha256(f"{PROMPT_VERSION}:{kind}:{text.strip().lower()}".encode()).hexdigest()
+
+async def get_cached_response(cache_key: str):
+    response = local_llm_cache.get(cache_key)
+    if response is None:
+        cached = await db.ai_cache.find_one({"hash": cache_key}, {"_id": 0, "response": 1})
+        if cached:
+            response = local_llm_cache[cache_key] = cached["response"]
+    return response
+
+async def cache_response(cache_key: str, response):
+    """Best effort: a failed cache write is logged, never allowed to discard the reply itself"""
+    local_llm_cache[cache_key] = response
+    now = datetime.now(timezone.utc)
     try:
-        if filename.lower().endswith(('.txt', '.log')):
-            return file_content.decode('utf-8', errors='ignore')
-        elif filename.lower().endswith('.json'):
-            return file_content.decode('utf-8', errors='ignore')
-        else:
-            # For other file types, return a description
-            return f"Medical file: {filename}\nFile size: {len(file_content)} bytes\nUploaded medical document for analysis."
+        # Upsert so concurrent requests with the same key don't trip the unique index
+        await db.ai_cache.update_one(
+            {"hash": cache_key},
+            {"$setOnInsert": {
+                "hash": cache_key,
+                "prompt_version": PROMPT_VERSION,
+                "response": response,
+                "created_at": now,
+                "expires_at": now + LLM_CACHE_TTL  # removed by the TTL index
+            }},
+            upsert=True
+        )
     except Exception as e:
-        logging.error(f"Error extracting text from file {filename}: {e}")
-        return f"Medical document: {filename} - Content extraction completed."
+        logging.error(f"AI cache write error: {e}")
+
+# content hash -> task running the cache lookup/LLM call for that content
+inflight_analyses: Dict[str, asyncio.Task] = {}
 
 async def analyze_medical_record(content: str, filename: str) -> dict:
-    """Analyze medical record using AI"""
-    try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"medical_analysis_{uuid.uuid4()}",
-            system_message="You are an expert medical AI assistant. Analyze medical records and provide comprehensive health assessments, risk predictions, and actionable recommendations."
-        ).with_model("openai", "gpt-4o")
-        
-        user_message = UserMessage(
-            text=f"""Analyze this medical record comprehensively and provide:
-
-1. **Summary**: Clear, patient-friendly explanation (2-3 sentences)
-2. **Risk Assessment**: Evaluate risk levels for:
-   - Cardiovascular disease
-   - Diabetes
-   - Hypertension
-   - Other relevant conditions
-3. **Health Metrics**: Extract any numerical values (BP, cholesterol, etc.)
-4. **Recommendations**: Specific lifestyle and medical recommendations
-5. **Priority Level**: High/Medium/Low priority for follow-up
+    """Analyze medical record using AI, reusing the stored analysis for an identical prompt
+    
+    Concurrent calls for the same prompt share one in-flight task, so a burst of identical
+    uploads costs a single LLM call. No lock is needed: get-then-set never yields the loop.
+    """
+    content_key = medical_analysis_key(content, filename)
+    task = inflight_analyses.get(content_key)
+    if task is None:
+        task = asyncio.create_task(load_or_run_analysis(content_key, content, filename))
+        inflight_analyses[content_key] = task
+        task.add_done_callback(lambda _: inflight_analyses.pop(content_key, None))
+    # Shielded so one caller going away doesn't cancel the call others are waiting on
+    return await asyncio.shield(task)
+
+async def load_or_run_analysis(content_key: str, content: str, filename: str) -> dict:
+    cached = await get_cached_response(content_key)
+    if cached is not None:
+        return cached
+    
+    analysis, cacheable = await run_medical_analysis(content, filename)
+    if cacheable:
+        await cache_response(content_key, analysis)
+    return analysis
+
+MEDICAL_ANALYSIS_UNAVAILABLE = {
+    "summary": "Medical record uploaded successfully. AI analysis temporarily unavailable.",
+    "risk_assessment": "Please consult healthcare provider for assessment.",
+    "health_metrics": {"status": "pending"},
+    "recommendations": "Follow prescribed treatment plan.",
+    "priority_level": "Medium"
+}
+
+def medical_analysis_message(content: str, filename: str) -> UserMessage:
+    return UserMessage(
+        text=f"""Analyze this medical record. Reply with a JSON object with keys:
+- summary (string): patient-friendly explanation, 2-3 sentences
+- risk_assessment (string): risk levels for cardiovascular disease, diabetes, hypertension and other relevant conditions
+- health_metrics (object): numerical values found (BP, cholesterol, etc.)
+- recommendations (string): specific lifestyle and medical recommendations
+- priority_level (string): High, Medium or Low priority for follow-up
 
 Medical Record: {filename}
-Content: {content}
+Content: {content}"""
+    )
 
-Please format your response as JSON with keys: summary, risk_assessment, health_metrics, recommendations, priority_level"""
-        )
-        
-        response = await chat.send_message(user_message)
-        
-        try:
-            analysis = json.loads(response)
-        except json.JSONDecodeError:
-            # Fallback parsing
-            analysis = {
-                "summary": response[:300] + "..." if len(response) > 300 else response,
-                "risk_assessment": "Comprehensive medical analysis completed. Consult healthcare provider for detailed assessment.",
-                "health_metrics": {"status": "extracted"},
-                "recommendations": "Follow medical advice and maintain regular checkups.",
-                "priority_level": "Medium"
-            }
-        
-        return analysis
+def medical_analysis_key(content: str, filename: str) -> str:
+    """Keyed on the whole prompt: the filename is part of it and often names the patient"""
+    return llm_cache_key("medical_analysis", medical_analysis_message(content, filename).text)
+
+MEDICAL_ANALYSIS_TEXT_FIELDS = ("summary", "risk_assessment", "recommendations", "priority_level")
+
+def as_text(value) -> str:
+    """Flatten a JSON value the model returned where a string was asked for"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return "; ".join(f"{key}: {as_text(item)}" for key, item in value.items())
+    if isinstance(value, list):
+        return "; ".join(as_text(item) for item in value)
+    return "" if value is None else str(value)
+
+def normalize_medical_analysis(parsed) -> Optional[dict]:
+    """Coerce a parsed reply to the string/object field types MedicalRecord stores; None if it isn't an object"""
+    if not isinstance(parsed, dict):
+        return None
+    analysis = {field: as_text(parsed[field]) for field in MEDICAL_ANALYSIS_TEXT_FIELDS if field in parsed}
+    health_metrics = parsed.get("health_metrics")
+    analysis["health_metrics"] = health_metrics if isinstance(health_metrics, dict) else {}
+    return analysis
+
+def parse_medical_analysis(response: str) -> tuple:
+    """Returns (analysis, cacheable); replies that aren't a JSON object get a fallback that is never cached"""
+    try:
+        analysis = normalize_medical_analysis(orjson.loads(response))
+    except orjson.JSONDecodeError:
+        analysis = None
+    if analysis is not None:
+        return analysis, True
+    # Fallback parsing
+    return {
+        "summary": response[:300] + "..." if len(response) > 300 else response,
+        "risk_assessment": "Comprehensive medical analysis completed. Consult healthcare provider for detailed assessment.",
+        "health_metrics": {"status": "extracted"},
+        "recommendations": "Follow medical advice and maintain regular checkups.",
+        "priority_level": "Medium"
+    }, False
+
+async def run_medical_analysis(content: str, filename: str) -> tuple:
+    """Call the LLM; returns (analysis, cacheable) where fallbacks are never cacheable"""
+    try:
+        chat = new_llm_chat("medical_analysis", MEDICAL_ANALYSIS_PROMPT, JSON_OBJECT_FORMAT)
+        response = await send_llm_message(chat, medical_analysis_message(content, filename))
+        return parse_medical_analysis(response)
     except Exception as e:
         logging.error(f"AI analysis error: {e}")
-        return {
-            "summary": "Medical record uploaded successfully. AI analysis temporarily unavailable.",
-            "risk_assessment": "Please consult healthcare provider for assessment.",
-            "health_metrics": {"status": "pending"},
-            "recommendations": "Follow prescribed treatment plan.",
-            "priority_level": "Medium"
-        }
+        return dict(MEDICAL_ANALYSIS_UNAVAILABLE), False
+
+async def send_llm_message(chat: LlmChat, user_message: UserMessage) -> str:
+    """send_message under an LLM slot and a deadline; TimeoutError falls through to the callers' fallbacks"""
+    async with LLM_SLOTS:
+        return await asyncio.wait_for(chat.send_message(user_message), timeout=LLM_TIMEOUT_SECONDS)
+
+async def stream_llm_reply(chat: LlmChat, user_message: UserMessage):
+    """Yield reply chunks as they arrive, or the whole reply at once if the SDK cannot stream"""
+    send_message_stream = getattr(chat, "send_message_stream", None)
+    if send_message_stream is None:
+        yield await send_llm_message(chat, user_message)
+        return
+    # Streams hold a slot too, but no overall deadline: the client sees progress as it happens
+    async with LLM_SLOTS:
+        async for chunk in send_message_stream(user_message):
+            yield chunk
+
+def sse_event(data: dict) -> str:
+    return f"data: {orjson.dumps(data).decode()}\n\n"
+
+# Strong references keep detached tasks alive until they finish; shutdown waits for them
+detached_tasks: set = set()
+
+def run_detached(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    detached_tasks.add(task)
+    task.add_done_callback(detached_tasks.discard)
+    return task
+
+async def stream_detached(produce):
+    """Relay the SSE events of produce(emit), which runs as a detached task
+
+    A client disconnect only stops this relay: the producer still finishes its LLM call and
+    persists the result, so tokens spent on a stream are never thrown away.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    
+    async def run():
+        try:
+            await produce(events.put_nowait)
+        except Exception as e:
+            # Nothing awaits this task, so the failure is logged and told to the client here
+            logging.error(f"Streamed generation error: {e}")
+            events.put_nowait(sse_event({"error": "Generation failed. Please try again."}))
+        finally:
+            events.put_nowait(None)
+    
+    run_detached(run())
+    while (event := await events.get()) is not None:
+        yield event
+
+# (habit field, points for a recorded value); fields left empty or zero don't count as factors
+HEALTH_SCORE_FACTORS = (
+    ('sleep_hours', lambda v: min(20, max(0, (v - 4) * 4))),  # 7-8 hours optimal
+    ('exercise_minutes', lambda v: min(25, v / 2)),  # 50+ minutes optimal
+    ('steps_count', lambda v: min(15, v / 667)),  # 10k steps optimal
+    ('water_glasses', lambda v: min(10, v * 1.25)),  # 8 glasses optimal
+    ('fruits_vegetables', lambda v: min(15, v * 3)),  # 5 servings optimal
+    ('mood_rating', lambda v: v * 3),  # 5 rating = 15 points
+    ('stress_level', lambda v: max(0, (6 - v) * 3)),  # Lower stress = higher score
+)
 
 def calculate_health_score(habit_data: dict) -> float:
-    """Calculate health score based on habit data"""
+    """Calculate health score based on habit data: the average of the recorded factors' points"""
     score = 0.0
     factors = 0
+    for field, points in HEALTH_SCORE_FACTORS:
+        value = habit_data.get(field)
+        if value:
+            score += points(value)
+            factors += 1
     
-    # Sleep (20 points max)
-    if habit_data.get('sleep_hours'):
-        sleep_score = min(20, max(0, (habit_data['sleep_hours'] - 4) * 4))  # 7-8 hours optimal
-        score += sleep_score
-        factors += 1
-    
-    # Exercise (25 points max)
-    if habit_data.get('exercise_minutes'):
-        exercise_score = min(25, habit_data['exercise_minutes'] / 2)  # 50+ minutes optimal
-        score += exercise_score
-        factors += 1
-    
-    # Steps (15 points max)
-    if habit_data.get('steps_count'):
-        steps_score = min(15, habit_data['steps_count'] / 667)  # 10k steps optimal
-        score += steps_score
-        factors += 1
-    
-    # Water (10 points max)
-    if habit_data.get('water_glasses'):
-        water_score = min(10, habit_data['water_glasses'] * 1.25)  # 8 glasses optimal
-        score += water_score
-        factors += 1
-    
-    # Nutrition (15 points max)
-    if habit_data.get('fruits_vegetables'):
-        nutrition_score = min(15, habit_data['fruits_vegetables'] * 3)  # 5 servings optimal
-        score += nutrition_score
-        factors += 1
-    
-    # Mental health (15 points max)
-    if habit_data.get('mood_rating'):
-        mood_score = habit_data['mood_rating'] * 3  # 5 rating = 15 points
-        score += mood_score
-        factors += 1
-        
-    if habit_data.get('stress_level'):
-        stress_score = (6 - habit_data['stress_level']) * 3  # Lower stress = higher score
-        score += max(0, stress_score)
-        factors += 1
-    
-    return score / max(1, factors) if factors > 0 else 0.0
+    return score / factors if factors else 0.0
 
-async def generate_paperwork(user_data: dict, form_request: PaperworkRequest) -> str:
-    """Generate smart paperwork using AI"""
-    try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"paperwork_{uuid.uuid4()}",
-            system_message="You are a professional medical administrative assistant. Generate accurate, complete medical forms and documents following healthcare standards."
-        ).with_model("openai", "gpt-4o")
-        
-        user_message = UserMessage(
-            text=f"""Generate a comprehensive {form_request.form_type} form with the following details:
+def paperwork_message(user_data: dict, form_request: PaperworkRequest) -> UserMessage:
+    return UserMessage(
+        text=f"""Generate a comprehensive {form_request.form_type} form with the following details:
 
 **Patient Information:**
 - Name: {user_data.get('name', 'Patient')}
@@ -322,13 +517,10 @@ Please create a professional medical {form_request.form_type} form with:
 7. HIPAA compliance notices
 
 Format as a professional medical document ready for hospital use."""
-        )
-        
-        response = await chat.send_message(user_message)
-        return response
-    except Exception as e:
-        logging.error(f"Paperwork generation error: {e}")
-        return f"""
+    )
+
+def paperwork_fallback(user_data: dict, form_request: PaperworkRequest) -> str:
+    return f"""
 MEDICAL {form_request.form_type.upper()} FORM
 
 Hospital: {form_request.hospital_name}
@@ -346,54 +538,88 @@ Appointment Date: {form_request.appointment_date or 'To be scheduled'}
 This form has been generated by HealthSync AI. Please complete additional details as required by your healthcare provider.
         """
 
+async def generate_paperwork(user_data: dict, form_request: PaperworkRequest) -> str:
+    """Generate smart paperwork using AI, reusing the stored form for an identical prompt"""
+    user_message = paperwork_message(user_data, form_request)
+    # Keyed on the whole prompt, patient details included, so forms are never shared between users
+    cache_key = llm_cache_key("paperwork", user_message.text)
+    cached = await get_cached_response(cache_key)
+    if cached is not None:
+        return cached
+    
+    try:
+        chat = new_llm_chat("paperwork", PAPERWORK_PROMPT)
+        response = await send_llm_message(chat, user_message)
+    except Exception as e:
+        logging.error(f"Paperwork generation error: {e}")
+        return paperwork_fallback(user_data, form_request)
+    
+    await cache_response(cache_key, response)
+    return response
+
 # Routes
 
 # File Upload Endpoint
+async def analyze_and_update_record(record_id: str, content: str, filename: str):
+    """Run the AI analysis for a stored record and write its results back"""
+    try:
+        analysis = await analyze_medical_record(content, filename)
+        await db.medical_records.update_one(
+            {"id": record_id},
+            {"$set": {
+                "ai_summary": analysis.get("summary", ""),
+                "risk_assessment": analysis.get("risk_assessment", ""),
+                "health_metrics": analysis.get("health_metrics", {})
+            }}
+        )
+    except Exception as e:
+        logging.error(f"Background analysis error for record {record_id}: {e}")
+
+def schedule_record_analysis(record_id: str, content: str, filename: str):
+    run_detached(analyze_and_update_record(record_id, content, filename))
+
 @api_router.post("/upload-medical-record")
 async def upload_medical_record(
+    background_tasks: BackgroundTasks,
     user_id: str = Form(...),
     file: UploadFile = File(...)
 ):
     """Upload and analyze medical records"""
     try:
-        # Validate file size (max 10MB)
-        if file.size and file.size > 10 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File too large. Maximum size is 10MB.")
-        
-        # Read file content
-        file_content = await file.read()
+        # Validate file size (max 10MB) up front when the client declared it
+        if file.size and file.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="File too large. Maximum size is 10MB.")
         
         # Extract text from file
-        extracted_text = await extract_text_from_file(file_content, file.filename)
-        
-        # Analyze with AI
-        analysis = await analyze_medical_record(extracted_text, file.filename)
-        
-        # Create medical record
-        record_data = {
-            "user_id": user_id,
-            "filename": file.filename,
-            "content": extracted_text,
-            "file_type": file.content_type or "application/octet-stream",
-            "file_size": file.size or len(file_content),
-            "ai_summary": analysis.get("summary", ""),
-            "risk_assessment": analysis.get("risk_assessment", ""),
-            "health_metrics": analysis.get("health_metrics", {})
-        }
+        extracted_text, file_size = await extract_text_from_file(file)
+        # Release the spooled upload before the slow LLM call
+        await file.close()
         
-        record_obj = MedicalRecord(**record_data)
-        record_dict = prepare_for_mongo(record_obj.dict())
-        await db.medical_records.insert_one(record_dict)
+        # Store the record right away; the AI fields are filled in by a background analysis
+        record_obj = MedicalRecord(
+            user_id=user_id,
+            filename=file.filename,
+            content=extracted_text,
+            file_type=file.content_type or "application/octet-stream",
+            file_size=file_size
+        )
+        await db.medical_records.insert_one(record_obj.model_dump())
+        schedule_record_analysis(record_obj.id, extracted_text, file.filename)
         
         # Award tokens for uploading record
-        await award_tokens(user_id, 50, f"Medical record upload: {file.filename}")
+        background_tasks.add_task(award_tokens, user_id, 50, f"Medical record upload: {file.filename}")
         
+        # Poll /medical-records/{record_id}/status for the analysis
         return {
-            "record": record_obj,
-            "analysis": analysis,
-            "message": "Medical record uploaded and analyzed successfully"
+            "record_id": record_obj.id,
+            "filename": record_obj.filename,
+            "upload_date": record_obj.upload_date,
+            "status": "pending",
+            "message": "Medical record uploaded; AI analysis in progress"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"File upload error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -401,43 +627,83 @@ async def upload_medical_record(
 # User Management
 @api_router.post("/users", response_model=User)
 async def create_user(user_data: UserCreate):
-    user_dict = user_data.dict()
-    user_obj = User(**user_dict)
-    user_dict = prepare_for_mongo(user_obj.dict())
-    await db.users.insert_one(user_dict)
+    user_obj = User(**user_data.model_dump())
+    await db.users.insert_one(user_obj.model_dump())
     return user_obj
 
 @api_router.get("/users/{user_id}", response_model=User)
 async def get_user(user_id: str):
-    user = await db.users.find_one({"id": user_id})
+    user = await load_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    user = parse_from_mongo(user)
-    return User(**user)
+    return user
 
 # Medical Records
-@api_router.post("/medical-records", response_model=MedicalRecord)
-async def create_medical_record(record_data: MedicalRecordCreate):
-    """Create medical record from text input"""
-    analysis = await analyze_medical_record(record_data.content, record_data.filename)
-    
-    record_dict = record_data.dict()
+async def save_medical_record(record_data: MedicalRecordCreate, analysis: dict, background_tasks: BackgroundTasks) -> MedicalRecord:
+    record_dict = record_data.model_dump()
     record_dict["ai_summary"] = analysis.get("summary", "")
     record_dict["risk_assessment"] = analysis.get("risk_assessment", "")
     record_dict["health_metrics"] = analysis.get("health_metrics", {})
     
     record_obj = MedicalRecord(**record_dict)
-    record_dict = prepare_for_mongo(record_obj.dict())
+    record_dict = record_obj.model_dump()
     await db.medical_records.insert_one(record_dict)
     
-    await award_tokens(record_data.user_id, 50, "Medical record entry")
-    
+    background_tasks.add_task(award_tokens, record_data.user_id, 50, "Medical record entry")
     return record_obj
 
-@api_router.get("/medical-records/{user_id}", response_model=List[MedicalRecord])
-async def get_user_medical_records(user_id: str):
-    records = await db.medical_records.find({"user_id": user_id}).sort("upload_date", -1).to_list(100)
-    return [MedicalRecord(**parse_from_mongo(record)) for record in records]
+async def produce_medical_record(record_data: MedicalRecordCreate, emit):
+    """Emit analysis deltas as they arrive, then save the record and emit it in a final event"""
+    user_message = medical_analysis_message(record_data.content, record_data.filename)
+    content_key = llm_cache_key("medical_analysis", user_message.text)
+    analysis = await get_cached_response(content_key)
+    if analysis is None:
+        parts = []
+        try:
+            chat = new_llm_chat("medical_analysis", MEDICAL_ANALYSIS_PROMPT, JSON_OBJECT_FORMAT)
+            async for chunk in stream_llm_reply(chat, user_message):
+                parts.append(chunk)
+                emit(sse_event({"delta": chunk}))
+            analysis, cacheable = parse_medical_analysis("".join(parts))
+        except Exception as e:
+            logging.error(f"AI analysis error: {e}")
+            analysis, cacheable = dict(MEDICAL_ANALYSIS_UNAVAILABLE), False
+        if cacheable:
+            await cache_response(content_key, analysis)
+    
+    # The response may already be gone, so the token award runs here rather than after it
+    background_tasks = BackgroundTasks()
+    record_obj = await save_medical_record(record_data, analysis, background_tasks)
+    await background_tasks()
+    emit(sse_event({"done": True, "record": record_obj.model_dump(mode="json")}))
+
+@api_router.post("/medical-records", response_model=MedicalRecord)
+async def create_medical_record(record_data: MedicalRecordCreate, background_tasks: BackgroundTasks, stream: bool = False):
+    """Create medical record from text input; stream=true returns the analysis as server-sent events"""
+    if stream:
+        return StreamingResponse(stream_detached(functools.partial(produce_medical_record, record_data)), media_type="text/event-stream")
+    
+    analysis = await analyze_medical_record(record_data.content, record_data.filename)
+    return await save_medical_record(record_data, analysis, background_tasks)
+
+@api_router.get("/medical-records/{user_id}")
+async def get_user_medical_records(user_id: str, include_content: bool = False):
+    """MedicalRecordPreview list by default; include_content=true returns full MedicalRecord documents"""
+    projection = NO_MONGO_ID if include_content else MEDICAL_RECORD_PREVIEW_PROJECTION
+    records = await db.medical_records.find({"user_id": user_id}, projection).sort("upload_date", -1).to_list(100)
+    return records
+
+@api_router.get("/medical-records/{record_id}/status")
+async def get_medical_record_status(record_id: str):
+    """Analysis progress for an uploaded record: pending until its AI summary is written"""
+    record = await db.medical_records.find_one(
+        {"id": record_id},
+        {"_id": 0, "id": 1, "ai_summary": 1, "risk_assessment": 1, "health_metrics": 1}
+    )
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found")
+    record["status"] = "pending" if record.get("ai_summary") is None else "complete"
+    return record
 
 @api_router.delete("/medical-records/{record_id}")
 async def delete_medical_record(record_id: str):
@@ -448,15 +714,10 @@ async def delete_medical_record(record_id: str):
 
 # Enhanced Habit Tracking
 @api_router.post("/habits", response_model=Habit)
-async def log_habit(habit_data: HabitCreate):
+async def log_habit(habit_data: HabitCreate, background_tasks: BackgroundTasks):
     today = datetime.now(timezone.utc).date().isoformat()
     
-    # Check if habit already logged today
-    existing = await db.habits.find_one({"user_id": habit_data.user_id, "date": today})
-    if existing:
-        raise HTTPException(status_code=400, detail="Habit already logged for today")
-    
-    habit_dict = habit_data.dict()
+    habit_dict = habit_data.model_dump()
     
     # Calculate comprehensive tokens
     tokens_earned = 0
@@ -486,50 +747,67 @@ async def log_habit(habit_data: HabitCreate):
     # Calculate health score impact
     health_score_impact = calculate_health_score(habit_dict)
     
-    habit_dict["date"] = today
-    habit_dict["tokens_earned"] = tokens_earned
-    habit_dict["health_score_impact"] = health_score_impact
-    
-    habit_obj = Habit(**habit_dict)
-    habit_dict = prepare_for_mongo(habit_obj.dict())
-    await db.habits.insert_one(habit_dict)
+    habit_obj = Habit(**habit_dict, date=today, tokens_earned=tokens_earned, health_score_impact=health_score_impact)
+    # The unique (user_id, date) index rejects a second log for today atomically
+    try:
+        await db.habits.insert_one(habit_obj.model_dump())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Habit already logged for today")
     
     # Update user's health score
     await db.users.update_one(
         {"id": habit_data.user_id},
         {"$set": {"health_score": min(100, max(0, health_score_impact))}}
     )
+    user_cache.pop(habit_data.user_id, None)
     
     # Award tokens
     if tokens_earned > 0:
-        await award_tokens(habit_data.user_id, tokens_earned, f"Healthy habits - {today}")
+        background_tasks.add_task(award_tokens, habit_data.user_id, tokens_earned, f"Healthy habits - {today}")
     
     return habit_obj
 
-@api_router.get("/habits/{user_id}", response_model=List[Habit])
+@api_router.get("/habits/{user_id}")
 async def get_user_habits(user_id: str):
-    habits = await db.habits.find({"user_id": user_id}).sort("date", -1).to_list(30)
-    return [Habit(**parse_from_mongo(habit)) for habit in habits]
+    habits = await db.habits.find({"user_id": user_id}, NO_MONGO_ID).sort("date", -1).to_list(30)
+    return habits
 
 @api_router.get("/habits/{user_id}/analytics")
 async def get_habit_analytics(user_id: str, days: int = 30):
     """Get habit analytics and trends"""
     start_date = (datetime.now(timezone.utc) - timedelta(days=days)).date().isoformat()
     
-    habits = await db.habits.find({
-        "user_id": user_id,
-        "date": {"$gte": start_date}
-    }).sort("date", 1).to_list(days)
+    # One $group pass in Mongo; counts only include truthy values, as the averages always have
+    cursor = await db.habits.aggregate([
+        {"$match": {"user_id": user_id, "date": {"$gte": start_date}}},
+        {"$sort": {"date": 1}},
+        {"$limit": max(1, days)},  # $limit must be positive
+        {"$group": {
+            "_id": None,
+            "days_logged": {"$sum": 1},
+            "sleep_sum": {"$sum": "$sleep_hours"},
+            "sleep_count": {"$sum": {"$cond": [{"$ifNull": ["$sleep_hours", False]}, 1, 0]}},
+            "exercise_sum": {"$sum": "$exercise_minutes"},
+            "exercise_count": {"$sum": {"$cond": [{"$ifNull": ["$exercise_minutes", False]}, 1, 0]}},
+            "tokens_earned": {"$sum": "$tokens_earned"},
+            "health_scores": {"$push": {"$ifNull": ["$health_score_impact", 0]}}
+        }}
+    ])
+    totals = await cursor.to_list(1)
+    totals = totals[0] if totals else {
+        "days_logged": 0, "sleep_sum": 0, "sleep_count": 0, "exercise_sum": 0,
+        "exercise_count": 0, "tokens_earned": 0, "health_scores": []
+    }
     
     # Calculate trends and averages
     analytics = {
-        "total_days_logged": len(habits),
-        "average_sleep": sum(h.get('sleep_hours', 0) for h in habits if h.get('sleep_hours')) / max(1, len([h for h in habits if h.get('sleep_hours')])),
-        "average_exercise": sum(h.get('exercise_minutes', 0) for h in habits if h.get('exercise_minutes')) / max(1, len([h for h in habits if h.get('exercise_minutes')])),
-        "total_tokens_earned": sum(h.get('tokens_earned', 0) for h in habits),
+        "total_days_logged": totals["days_logged"],
+        "average_sleep": totals["sleep_sum"] / max(1, totals["sleep_count"]),
+        "average_exercise": totals["exercise_sum"] / max(1, totals["exercise_count"]),
+        "total_tokens_earned": totals["tokens_earned"],
         "current_streak": 0,  # Calculate streak
         "weekly_trends": {},
-        "health_score_trend": [h.get('health_score_impact', 0) for h in habits[-7:]]
+        "health_score_trend": totals["health_scores"][-7:]
     }
     
     return analytics
@@ -538,28 +816,17 @@ async def get_habit_analytics(user_id: str, days: int = 30):
 @api_router.post("/health-goals")
 async def create_health_goal(goal_data: dict):
     goal = HealthGoal(**goal_data)
-    goal_dict = prepare_for_mongo(goal.dict())
+    goal_dict = goal.model_dump()
     await db.health_goals.insert_one(goal_dict)
     return goal
 
 @api_router.get("/health-goals/{user_id}")
 async def get_user_health_goals(user_id: str):
-    goals = await db.health_goals.find({"user_id": user_id}).sort("created_date", -1).to_list(20)
-    return [HealthGoal(**parse_from_mongo(goal)) for goal in goals]
+    goals = await db.health_goals.find({"user_id": user_id}, NO_MONGO_ID).sort("created_date", -1).to_list(20)
+    return goals
 
 # Enhanced Smart Paperwork
-@api_router.post("/paperwork")
-async def generate_smart_paperwork(paperwork_request: PaperworkRequest):
-    # Get user data
-    user = await db.users.find_one({"id": paperwork_request.user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user_data = parse_from_mongo(user)
-    
-    # Generate paperwork
-    paperwork_content = await generate_paperwork(user_data, paperwork_request)
-    
+async def save_paperwork(paperwork_request: PaperworkRequest, paperwork_content: str, background_tasks: BackgroundTasks) -> dict:
     # Save as template if requested
     template = PaperworkTemplate(
         user_id=paperwork_request.user_id,
@@ -567,11 +834,11 @@ async def generate_smart_paperwork(paperwork_request: PaperworkRequest):
         form_type=paperwork_request.form_type,
         content=paperwork_content
     )
-    template_dict = prepare_for_mongo(template.dict())
+    template_dict = template.model_dump()
     await db.paperwork_templates.insert_one(template_dict)
     
     # Award tokens
-    await award_tokens(paperwork_request.user_id, 25, f"Smart paperwork: {paperwork_request.form_type}")
+    background_tasks.add_task(award_tokens, paperwork_request.user_id, 25, f"Smart paperwork: {paperwork_request.form_type}")
     
     return {
         "form_type": paperwork_request.form_type,
@@ -580,10 +847,50 @@ async def generate_smart_paperwork(paperwork_request: PaperworkRequest):
         "generated_at": datetime.now(timezone.utc).isoformat()
     }
 
+async def produce_paperwork(user: dict, paperwork_request: PaperworkRequest, emit):
+    """Emit form text deltas as they arrive, then save the template and emit it in a final event"""
+    user_message = paperwork_message(user, paperwork_request)
+    cache_key = llm_cache_key("paperwork", user_message.text)
+    paperwork_content = await get_cached_response(cache_key)
+    if paperwork_content is None:
+        parts = []
+        try:
+            chat = new_llm_chat("paperwork", PAPERWORK_PROMPT)
+            async for chunk in stream_llm_reply(chat, user_message):
+                parts.append(chunk)
+                emit(sse_event({"delta": chunk}))
+            paperwork_content = "".join(parts)
+        except Exception as e:
+            logging.error(f"Paperwork generation error: {e}")
+            paperwork_content = paperwork_fallback(user, paperwork_request)
+        else:
+            # Outside the try: a cache failure must not replace the form the client already received
+            await cache_response(cache_key, paperwork_content)
+    
+    # The response may already be gone, so the token award runs here rather than after it
+    background_tasks = BackgroundTasks()
+    result = await save_paperwork(paperwork_request, paperwork_content, background_tasks)
+    await background_tasks()
+    emit(sse_event({"done": True, **result}))
+
+@api_router.post("/paperwork")
+async def generate_smart_paperwork(paperwork_request: PaperworkRequest, background_tasks: BackgroundTasks, stream: bool = False):
+    # Get user data
+    user = await load_user(paperwork_request.user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    if stream:
+        return StreamingResponse(stream_detached(functools.partial(produce_paperwork, user, paperwork_request)), media_type="text/event-stream")
+    
+    # Generate paperwork
+    paperwork_content = await generate_paperwork(user, paperwork_request)
+    return await save_paperwork(paperwork_request, paperwork_content, background_tasks)
+
 @api_router.get("/paperwork-templates/{user_id}")
 async def get_paperwork_templates(user_id: str):
-    templates = await db.paperwork_templates.find({"user_id": user_id}).sort("created_date", -1).to_list(50)
-    return [PaperworkTemplate(**parse_from_mongo(template)) for template in templates]
+    templates = await db.paperwork_templates.find({"user_id": user_id}, NO_MONGO_ID).sort("created_date", -1).to_list(50)
+    return templates
 
 @api_router.post("/paperwork-templates/{template_id}/favorite")
 async def toggle_template_favorite(template_id: str):
@@ -600,30 +907,75 @@ async def toggle_template_favorite(template_id: str):
     return {"message": f"Template {'added to' if new_favorite_status else 'removed from'} favorites"}
 
 # Token System
+# Awards are queued and written in batches, so /tokens can trail a fresh award by up to one flush
+TOKEN_FLUSH_MAX = 100
+TOKEN_FLUSH_SECONDS = 0.2
+token_queue: asyncio.Queue = asyncio.Queue()
+
 async def award_tokens(user_id: str, amount: int, description: str):
-    """Award tokens to user and log transaction"""
-    await db.users.update_one(
-        {"id": user_id},
-        {"$inc": {"tokens": amount}}
-    )
-    
+    """Award tokens to user and log transaction; queued for flush_token_awards to write"""
     transaction = TokenTransaction(
         user_id=user_id,
         amount=amount,
         transaction_type="earned",
         description=description
     )
-    transaction_dict = prepare_for_mongo(transaction.dict())
-    await db.token_transactions.insert_one(transaction_dict)
+    token_queue.put_nowait(transaction.model_dump())
+
+async def flush_token_awards():
+    """Drain token_queue into batches of up to TOKEN_FLUSH_MAX awards or TOKEN_FLUSH_SECONDS; None stops it"""
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        item = await token_queue.get()
+        deadline = loop.time() + TOKEN_FLUSH_SECONDS
+        batch = []
+        while True:
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+            if len(batch) >= TOKEN_FLUSH_MAX:
+                break
+            try:
+                item = token_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(token_queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+        
+        if batch:
+            try:
+                await write_token_awards(batch)
+            except Exception as e:
+                logging.error(f"Token award flush error: {e}")
+
+async def write_token_awards(transactions: List[dict]):
+    """One insert_many for the transactions and one bulk $inc per user for the balances"""
+    per_user = defaultdict(int)
+    for transaction in transactions:
+        per_user[transaction["user_id"]] += transaction["amount"]
+    
+    await asyncio.gather(
+        db.token_transactions.insert_many(transactions, ordered=False),
+        db.users.bulk_write([UpdateOne({"id": user_id}, {"$inc": {"tokens": amount}}) for user_id, amount in per_user.items()], ordered=False)
+    )
+    for user_id in per_user:
+        user_cache.pop(user_id, None)
 
 @api_router.get("/tokens/{user_id}")
 async def get_user_tokens(user_id: str):
-    user = await db.users.find_one({"id": user_id})
+    user, transactions = await asyncio.gather(
+        load_user(user_id),
+        db.token_transactions.find({"user_id": user_id}, NO_MONGO_ID).sort("timestamp", -1).to_list(100)
+    )
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    transactions = await db.token_transactions.find({"user_id": user_id}).sort("timestamp", -1).to_list(100)
-    
     # Calculate token statistics
     total_earned = sum(t.get('amount', 0) for t in transactions if t.get('transaction_type') == 'earned')
     total_spent = sum(t.get('amount', 0) for t in transactions if t.get('transaction_type') == 'spent')
@@ -632,45 +984,81 @@ async def get_user_tokens(user_id: str):
         "current_tokens": user.get("tokens", 0),
         "total_earned": total_earned,
         "total_spent": total_spent,
-        "transaction_history": [TokenTransaction(**parse_from_mongo(t)) for t in transactions]
+        "transaction_history": transactions
     }
 
 # Dashboard Data
+def user_lookup(collection: str, pipeline: list, as_field: str) -> dict:
+    """$lookup of a user's documents in another collection; localField/foreignField keeps it on the user_id index"""
+    return {"$lookup": {"from": collection, "localField": "id", "foreignField": "user_id", "pipeline": pipeline, "as": as_field}}
+
 @api_router.get("/dashboard/{user_id}")
 async def get_dashboard_data(user_id: str):
-    # Get user
-    user = await db.users.find_one({"id": user_id})
-    if not user:
+    # One round trip: the user document with recent records, last 7 habits, open goals and token total joined on
+    cursor = await db.users.aggregate([
+        {"$match": {"id": user_id}},
+        {"$limit": 1},
+        user_lookup("medical_records", [
+            {"$sort": {"upload_date": -1}},
+            {"$limit": 5},
+            {"$project": MEDICAL_RECORD_PREVIEW_PROJECTION}
+        ], "recent_records"),
+        user_lookup("habits", [{"$sort": {"date": -1}}, {"$limit": 7}, {"$project": NO_MONGO_ID}], "recent_habits"),
+        user_lookup("health_goals", [{"$match": {"is_achieved": False}}, {"$limit": 3}, {"$project": NO_MONGO_ID}], "health_goals"),
+        user_lookup("token_transactions", [
+            {"$match": {"transaction_type": "earned"}},
+            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+        ], "tokens_earned"),
+        {"$project": NO_MONGO_ID}
+    ])
+    dashboard = await cursor.to_list(1)
+    if not dashboard:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get recent medical records
-    records = await db.medical_records.find({"user_id": user_id}).sort("upload_date", -1).limit(5).to_list(5)
-    
-    # Get recent habits (last 7 days)
-    habits = await db.habits.find({"user_id": user_id}).sort("date", -1).limit(7).to_list(7)
-    
-    # Get health goals
-    goals = await db.health_goals.find({"user_id": user_id, "is_achieved": False}).limit(3).to_list(3)
-    
-    # Get token summary
-    total_earned = await db.token_transactions.aggregate([
-        {"$match": {"user_id": user_id, "transaction_type": "earned"}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]).to_list(1)
+    user = dashboard[0]
+    records = user.pop("recent_records")
+    habits = user.pop("recent_habits")
+    goals = user.pop("health_goals")
+    tokens_earned = user.pop("tokens_earned")
     
     # Calculate habit streak
     habit_streak = len(habits) if habits else 0
     
     return {
-        "user": User(**parse_from_mongo(user)),
-        "recent_records": [MedicalRecord(**parse_from_mongo(r)) for r in records],
-        "recent_habits": [Habit(**parse_from_mongo(h)) for h in habits],
-        "health_goals": [HealthGoal(**parse_from_mongo(g)) for g in goals],
-        "tokens_earned_total": total_earned[0]["total"] if total_earned else 0,
+        "user": user,
+        "recent_records": records,
+        "recent_habits": habits,
+        "health_goals": goals,
+        "tokens_earned_total": tokens_earned[0]["total"] if tokens_earned else 0,
         "habit_streak": habit_streak,
         "health_score": user.get("health_score", 85.0)
     }
 
+# Batch Requests
+BATCH_MAX_REQUESTS = 20
+
+@api_router.post("/batch")
+async def batch_requests(batch_request: BatchRequest):
+    """Run several GET requests in one round trip, dispatched in-process through the ASGI app"""
+    if len(batch_request.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} requests per batch")
+    
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False), base_url="http://batch") as batch_client:
+        async def dispatch(item: BatchRequestItem) -> dict:
+            if item.method.upper() != "GET" or not item.url.startswith("/api/"):
+                return {"id": item.id, "status": 400, "body": {"detail": "Only GET requests to /api/ routes can be batched"}}
+            # A failing sub-request comes back as its own 500 instead of failing the whole batch
+            response = await batch_client.get(item.url)
+            try:
+                body = orjson.loads(response.content)
+            except orjson.JSONDecodeError:
+                body = response.text
+            return {"id": item.id, "status": response.status_code, "body": body}
+        
+        responses = await asyncio.gather(*(dispatch(item) for item in batch_request.requests))
+    
+    return {"responses": responses}
+
 # Health Routes
 @api_router.get("/")
 async def root():
@@ -683,6 +1071,27 @@ async def health_check():
 # Include router
 app.include_router(api_router)
 
+class UploadSizeLimitMiddleware:
+    """Reject oversized uploads by Content-Length before Starlette spools the multipart body
+
+    Route dependencies run only after the form is parsed, so the check has to sit in front of
+    the app. Chunked uploads carry no Content-Length and fall back to extract_text_sync's limit.
+    """
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/api/upload-medical-record":
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > MAX_UPLOAD_REQUEST_BYTES:
+                response = ORJSONResponse({"detail": "File too large. Maximum size is 10MB."}, status_code=413)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Added before CORS so the 413 still carries CORS headers
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -699,10 +1108,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
-
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    # Worker processes need the app as an import string; uvloop/httptools replace the pure-Python loop and parser
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=8001,
+        loop="uvloop",
+        http="httptools",
+        # Work is I/O-bound on Mongo and the LLM API; past a few processes extra workers only add pools
+        workers=min(os.cpu_count() or 1, 4),
+        log_level="info"
+    )
\ No newline at end of file
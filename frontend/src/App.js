@@ -659,6 +659,23 @@ const MedicalRecordsTab = ({ userId }) => {
     }
   };
 
+  const pollAnalysis = async (recordId, attempts = 30) => {
+    for (let i = 0; i < attempts; i++) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      try {
+        const response = await axios.get(`${API}/medical-records/${recordId}/status`);
+        if (response.data.status === 'complete') {
+          toast.success('AI analysis complete!');
+          fetchRecords();
+          return;
+        }
+      } catch (error) {
+        console.error('Error polling analysis status:', error);
+        return;
+      }
+    }
+  };
+
   const onDrop = useCallback(async (acceptedFiles) => {
     const file = acceptedFiles[0];
     if (!file) return;
@@ -673,8 +690,9 @@ const MedicalRecordsTab = ({ userId }) => {
         headers: { 'Content-Type': 'multipart/form-data' }
       });
       
-      toast.success('Medical record uploaded and analyzed successfully!');
+      toast.success('Medical record uploaded! AI analysis in progress...');
       fetchRecords();
+      pollAnalysis(response.data.record_id);
     } catch (error) {
       console.error('Upload error:', error);
       toast.error('Failed to upload record. Please try again.');